@@ -1,12 +1,60 @@
 import datetime as dt
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
+import orjson
 import pandas as pd
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
+
+# --- Shared HTTP session -----------------------------------------------------
+
+# One keep-alive session so the Octopus / Elexon TLS handshakes are paid once,
+# with a short backoff retry for transient gateway errors. Read timeouts are
+# not retried, so a hung call still gives up after its own timeout.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=3, read=0, connect=1, backoff_factor=0.3, status_forcelist=(502, 503, 504)
+    ),
+))
+
+
+# --- Frame helpers -----------------------------------------------------------
+
+def sort_by_start(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sort rows by 'start' using the int64 nanosecond view, skipping the sort
+    when the rows are already in order.
+    """
+    ns = df["start"].to_numpy(dtype="datetime64[ns]").view("i8")
+    if not (np.diff(ns) >= 0).all():
+        df = df.iloc[np.argsort(ns, kind="stable")]
+    return df.reset_index(drop=True)
+
 
 # --- Octopus Agile helper ----------------------------------------------------
 
 OCTOPUS_BASE = "https://api.octopus.energy/v1"
+OCTOPUS_PAGE_SIZE = 1500
+
+# Both Octopus and Elexon return ISO 8601 UTC timestamps ("2024-10-01T23:30:00Z");
+# naming the format keeps pandas on its C parser instead of per-element inference
+API_TIME_FORMAT = "ISO8601"
+
+
+def _get_octopus_page(url: str, params: dict) -> dict:
+    """
+    Fetch and decode one page of Octopus results, raising on HTTP errors.
+    """
+    r = SESSION.get(url, params=params, timeout=15)
+    r.raise_for_status()
+    return orjson.loads(r.content)
 
 
 def get_agile_prices(product_code: str,
@@ -24,130 +72,314 @@ def get_agile_prices(product_code: str,
     params = {
         "period_from": start_utc.isoformat(timespec="seconds").replace("+00:00", "Z"),
         "period_to": end_utc.isoformat(timespec="seconds").replace("+00:00", "Z"),
-        "page_size": 1500,
+        "page_size": OCTOPUS_PAGE_SIZE,
     }
 
-    results = []
-    while url:
-        r = requests.get(url, params=params if not results else None, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        results.extend(data.get("results", []))
-        url = data.get("next")
+    first = _get_octopus_page(url, params)
+    count = first.get("count", len(first.get("results", [])))
+
+    # Pre-size the list from the reported count and fill it page by page. If
+    # the count is missing this only covers the first page; the pages found
+    # by walking 'next' below then grow the list through the slice assignment.
+    results = [None] * count
+    filled = 0
+
+    def collect(chunk: list) -> None:
+        nonlocal filled
+        results[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+
+    collect(first.get("results", []))
+
+    # When the first page reports the total row count, the remaining pages can
+    # be requested concurrently over the shared session. The page size comes
+    # from the first page itself, as the server may cap the requested size.
+    # Without a count, fall back to walking the 'next' links one at a time.
+    page_size = len(first.get("results", []))
+    next_url = first.get("next")
+    if next_url and "count" in first and page_size:
+        n_pages = math.ceil(first["count"] / page_size)
+        page_params = [{**params, "page": p} for p in range(2, n_pages + 1)]
+        if page_params:
+            with ThreadPoolExecutor(max_workers=min(len(page_params), 4)) as ex:
+                for page in ex.map(lambda p: _get_octopus_page(url, p), page_params):
+                    collect(page.get("results", []))
+    else:
+        while next_url:
+            page = _get_octopus_page(next_url, None)
+            collect(page.get("results", []))
+            next_url = page.get("next")
+
+    # Rows can shift between page requests; drop any unfilled tail
+    del results[filled:]
 
     if not results:
         return pd.DataFrame()
 
-    df = pd.DataFrame(results)
-    df["start"] = pd.to_datetime(df["valid_from"], utc=True)
-    df["end"] = pd.to_datetime(df["valid_to"], utc=True)
-    df["agile_p_per_kwh"] = df["value_inc_vat"].astype(float)
-    df = df.sort_values("start").reset_index(drop=True)
-    return df[["start", "end", "agile_p_per_kwh"]]
+    # Build the columns straight from the records rather than via a
+    # row-oriented DataFrame of every field the API returns
+    df = pd.DataFrame({
+        "start": pd.to_datetime(
+            [r["valid_from"] for r in results], utc=True, format=API_TIME_FORMAT, cache=True
+        ),
+        "end": pd.to_datetime(
+            [r["valid_to"] for r in results], utc=True, format=API_TIME_FORMAT, cache=True
+        ),
+        "agile_p_per_kwh": np.fromiter(
+            (r["value_inc_vat"] for r in results), dtype=np.float64, count=len(results)
+        ),
+    })
+    return sort_by_start(df)
 
 
 # --- Elexon system price (DISEBSP) helper ------------------------------------
 
+ELEXON_SYSTEM_PRICES_URL = (
+    "https://data.elexon.co.uk/bmrs/api/v1/"
+    "balancing/settlement/system-prices"
+)
+
+
+def get_system_price_columns(settlement_date: dt.date) -> tuple[list, list]:
+    """
+    Raw (startTime, systemSellPrice) columns for one settlement day.
+    Raises if the request fails, so a failed day is never cached.
+    """
+    url = f"{ELEXON_SYSTEM_PRICES_URL}/{settlement_date.strftime('%Y-%m-%d')}?format=json"
+    r = SESSION.get(url, timeout=15)
+    r.raise_for_status()
+    # Only the two needed fields are kept, so the decoded JSON tree is
+    # released as soon as the day has been read
+    items = orjson.loads(r.content).get("data") or []
+    return [i["startTime"] for i in items], [i["systemSellPrice"] for i in items]
+
+
 def get_system_prices_today_and_tomorrow(now_utc: dt.datetime) -> pd.DataFrame:
     """
     Get system prices from Elexon Insights (DISEBSP) for today and tomorrow.
     Returns UTC 'start' and price in p/kWh (systemSellPrice).
+    Each day is cached separately; a day whose request fails is skipped.
     """
-    base_url = (
-        "https://data.elexon.co.uk/bmrs/api/v1/"
-        "balancing/settlement/system-prices"
-    )
-
     today = now_utc.date()
     tomorrow = today + dt.timedelta(days=1)
     dates = [today, tomorrow]
 
-    dfs = []
-    for d in dates:
-        settlement_date = d.strftime("%Y-%m-%d")
-        url = f"{base_url}/{settlement_date}?format=json"
-        try:
-            r = requests.get(url, timeout=15)
-        except Exception:
-            continue
-        if r.status_code != 200:
-            continue
-        data = r.json()
-        items = data.get("data") or []
-        if not items:
-            continue
-        df_d = pd.DataFrame(items)
-        dfs.append(df_d)
-
-    if not dfs:
+    # Both days are independent, so fetch them concurrently
+    starts, prices = [], []
+    with ThreadPoolExecutor(max_workers=len(dates),
+                            initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as ex:
+        futures = [ex.submit(_cached_system_day, d.isoformat()) for d in dates]
+        for fut in as_completed(futures):
+            try:
+                day_starts, day_prices = fut.result()
+            except Exception:
+                continue
+            starts.extend(day_starts)
+            prices.extend(day_prices)
+
+    if not starts:
         return pd.DataFrame()
 
-    df = pd.concat(dfs, ignore_index=True)
-    df["start"] = pd.to_datetime(df["startTime"], utc=True)
-    df["system_gbp_per_mwh"] = df["systemSellPrice"].astype(float)
-    df["system_p_per_kwh"] = df["system_gbp_per_mwh"] * 100 / 1000
-    df = df.sort_values("start").reset_index(drop=True)
-    return df[["start", "system_p_per_kwh"]]
+    df = pd.DataFrame({
+        "start": pd.to_datetime(starts, utc=True, format=API_TIME_FORMAT, cache=True),
+        # systemSellPrice is GBP/MWh; convert to p/kWh
+        "system_p_per_kwh": np.asarray(prices, dtype=np.float64) * 100 / 1000,
+    })
+    return sort_by_start(df)
+
+
+# --- Cached fetchers ---------------------------------------------------------
+
+# Streamlit re-runs the whole script on every widget interaction; cache the
+# network fetches so identical requests within 15 minutes are served locally.
+FETCH_TTL_S = 900
+
+
+def floor_to_slot(ts: dt.datetime) -> dt.datetime:
+    """
+    Floor a datetime to the start of its half-hour slot (stable cache key).
+    """
+    return ts.replace(minute=(ts.minute // 30) * 30, second=0, microsecond=0)
+
+
+@st.cache_data(ttl=FETCH_TTL_S, show_spinner=False)
+def _cached_agile(product_code: str,
+                  region_code: str,
+                  start_iso: str,
+                  end_iso: str) -> pd.DataFrame:
+    return get_agile_prices(
+        product_code=product_code,
+        region_code=region_code,
+        start_utc=dt.datetime.fromisoformat(start_iso),
+        end_utc=dt.datetime.fromisoformat(end_iso),
+    )
+
+
+@st.cache_data(ttl=FETCH_TTL_S, show_spinner=False)
+def _cached_system_day(date_iso: str) -> tuple[list, list]:
+    # A failed day raises, and Streamlit does not cache exceptions, so it is
+    # retried on the next run while the other day stays cached
+    return get_system_price_columns(dt.date.fromisoformat(date_iso))
 
 
 # --- Cheapness calculation ---------------------------------------------------
 
+HALF_HOUR_NS = np.int64(30 * 60 * 1_000_000_000)
+
+
 def floor_to_half_hour(ts: pd.Series) -> pd.Series:
     """
     Floor timestamps to the nearest half-hour (UTC).
     """
-    ts = ts.dt.tz_convert("UTC")
-    minutes = (ts.dt.minute // 30) * 30
-    return ts.dt.floor("H") + pd.to_timedelta(minutes, unit="m")
+    # Work on the raw UTC nanoseconds: one modulo/subtract, no tz round-trips
+    ns = ts.dt.tz_convert("UTC").to_numpy(dtype="datetime64[ns]").view("i8")
+    floored = pd.to_datetime(ns - ns % HALF_HOUR_NS, unit="ns", utc=True)
+    return pd.Series(floored, index=ts.index)
 
 
-def compute_cheapness(agile_df: pd.DataFrame,
-                      system_df: pd.DataFrame) -> pd.DataFrame:
+def cheapness_kernel(agile: np.ndarray, system: np.ndarray) -> np.ndarray:
     """
-    Compute cheapness only on the overlapping time window between Agile and system prices.
+    Min-max normalise both price arrays and blend them into a 0–100 score.
+    A flat series (max == min) normalises to 0.5.
+    """
+    a_min, a_max = agile.min(), agile.max()
+    s_min, s_max = system.min(), system.max()
+    a_norm = (agile - a_min) / (a_max - a_min) if a_max > a_min else 0.5
+    s_norm = (system - s_min) / (s_max - s_min) if s_max > s_min else 0.5
+    return 100 * (1 - 0.5 * a_norm - 0.5 * s_norm)
+
+
+def align_prices(agile_df: pd.DataFrame,
+                 system_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Join Agile and system prices per half-hour slot over their overlapping window.
     """
     if agile_df.empty or system_df.empty:
         return pd.DataFrame()
 
-    # Find overlap window
-    start_overlap = max(agile_df["start"].min(), system_df["start"].min())
-    end_overlap = min(agile_df["start"].max(), system_df["start"].max())
-    if start_overlap >= end_overlap:
-        return pd.DataFrame()
+    # Snap to half-hour slots in fresh frames rather than copies of the inputs;
+    # keep the latest row for any duplicate slot
+    a = pd.DataFrame({
+        "start": floor_to_half_hour(agile_df["start"]),
+        "agile_p_per_kwh": agile_df["agile_p_per_kwh"],
+    })
+    s = pd.DataFrame({
+        "start": floor_to_half_hour(system_df["start"]),
+        "system_p_per_kwh": system_df["system_p_per_kwh"],
+    })
+    a = a.sort_values("start").drop_duplicates(subset="start", keep="last")
+    s = s.sort_values("start").drop_duplicates(subset="start", keep="last")
+
+    # Single-pass nearest-slot join; rows outside the overlap drop out as NaN
+    df = pd.merge_asof(
+        a, s, on="start", direction="nearest", tolerance=pd.Timedelta("15min")
+    )
+    return df.dropna(subset=["system_p_per_kwh"]).reset_index(drop=True)
 
-    # Restrict both to that window
-    a = agile_df[(agile_df["start"] >= start_overlap) & (agile_df["start"] <= end_overlap)].copy()
-    s = system_df[(system_df["start"] >= start_overlap) & (system_df["start"] <= end_overlap)].copy()
 
-    # Align to half-hour buckets
-    a["slot"] = floor_to_half_hour(a["start"])
-    s["slot"] = floor_to_half_hour(s["start"])
+def compute_cheapness(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Score aligned Agile / system prices (see align_prices) from 0 (dear) to 100 (cheap).
+    """
+    if df.empty:
+        return pd.DataFrame()
 
-    a = a.groupby("slot", as_index=False).agg(
-        {"agile_p_per_kwh": "mean", "end": "max"}
-    )
-    s = s.groupby("slot", as_index=False).agg(
-        {"system_p_per_kwh": "mean"}
+    df["cheapness_score"] = cheapness_kernel(
+        df["agile_p_per_kwh"].to_numpy(dtype=np.float64),
+        df["system_p_per_kwh"].to_numpy(dtype=np.float64),
     )
+    df["end"] = df["start"] + pd.Timedelta("30min")
+
+    return df[["start", "end", "agile_p_per_kwh", "system_p_per_kwh", "cheapness_score"]]
 
-    df = pd.merge(a, s, on="slot", how="inner")
-    if df.empty:
-        return pd.DataFrame()
 
-    df = df.rename(columns={"slot": "start"})
+# --- Incremental slot cache --------------------------------------------------
 
-    # Normalise Agile
-    a_min, a_max = df["agile_p_per_kwh"].min(), df["agile_p_per_kwh"].max()
-    df["agile_norm"] = (df["agile_p_per_kwh"] - a_min) / (a_max - a_min) if a_max > a_min else 0.5
+def get_slot_cache(product_code: str,
+                   region_code: str,
+                   now_utc: dt.datetime) -> dict:
+    """
+    Per-session {slot_ns: (agile_p_per_kwh, system_p_per_kwh)} of aligned slots.
+    Agile rates never change once published, so Agile only needs fetching
+    from the first uncached slot (see first_missing_slot). Elexon system
+    prices can be revised, so the system half of each entry is refreshed on
+    every fetch (see refresh_system_prices). Reset when the tariff changes;
+    slots that have slipped out of the window are dropped.
+    """
+    key = (product_code, region_code)
+    if st.session_state.get("slot_cache_key") != key:
+        st.session_state["slot_cache_key"] = key
+        st.session_state["slot_cache"] = {}
+        st.session_state.pop("cheap_cache", None)
 
-    # Normalise system price
-    s_min, s_max = df["system_p_per_kwh"].min(), df["system_p_per_kwh"].max()
-    df["system_norm"] = (df["system_p_per_kwh"] - s_min) / (s_max - s_min) if s_max > s_min else 0.5
+    cache = st.session_state["slot_cache"]
+    now_ns = pd.Timestamp(now_utc).value
+    for slot in [k for k in cache if k < now_ns]:
+        del cache[slot]
+    return cache
 
-    df["cheapness_score"] = 100 * (1 - 0.5 * df["agile_norm"] - 0.5 * df["system_norm"])
-    df["end"] = df["start"] + pd.Timedelta("30min")
 
-    return df[["start", "end", "agile_p_per_kwh", "system_p_per_kwh", "cheapness_score"]]
+def first_missing_slot(cache: dict, now_utc: dt.datetime) -> dt.datetime:
+    """
+    Start of the first slot from now onwards that is not cached, so a gap left
+    by a failed or unpublished fetch is filled on the next run.
+    """
+    slot = pd.Timestamp(now_utc).value
+    while slot in cache:
+        slot += int(HALF_HOUR_NS)
+    return pd.Timestamp(slot, tz="UTC").to_pydatetime()
+
+
+def update_slot_cache(cache: dict, aligned_df: pd.DataFrame) -> None:
+    """
+    Merge aligned rows into the slot cache, invalidating cheap_cache on change.
+    """
+    if aligned_df.empty:
+        return
+    starts = aligned_df["start"].to_numpy(dtype="datetime64[ns]").view("i8")
+    new = dict(zip(
+        starts.tolist(),
+        zip(aligned_df["agile_p_per_kwh"].tolist(), aligned_df["system_p_per_kwh"].tolist()),
+    ))
+    if any(cache.get(slot) != prices for slot, prices in new.items()):
+        cache.update(new)
+        st.session_state.pop("cheap_cache", None)
+
+
+def refresh_system_prices(cache: dict, system_df: pd.DataFrame) -> None:
+    """
+    Overwrite the system price of cached slots with the latest Elexon values.
+    """
+    if system_df.empty:
+        return
+    slots = floor_to_half_hour(system_df["start"]).to_numpy(dtype="datetime64[ns]").view("i8")
+    changed = False
+    for slot, price in zip(slots.tolist(), system_df["system_p_per_kwh"].tolist()):
+        if slot in cache and cache[slot][1] != price:
+            cache[slot] = (cache[slot][0], price)
+            changed = True
+    if changed:
+        st.session_state.pop("cheap_cache", None)
+
+
+def cheapness_from_slot_cache(cache: dict) -> pd.DataFrame:
+    """
+    Cheapness table for the cached slots. The score is only recomputed when
+    the cached window's edges have moved or a cached price has changed.
+    """
+    edges = (min(cache), max(cache), len(cache))
+    cached = st.session_state.get("cheap_cache")
+    if cached is not None and cached[0] == edges:
+        return cached[1].copy()
+
+    df = pd.DataFrame.from_dict(
+        cache, orient="index", columns=["agile_p_per_kwh", "system_p_per_kwh"]
+    ).sort_index()
+    df.insert(0, "start", pd.to_datetime(df.index.to_numpy(), unit="ns", utc=True))
+    cheap_df = compute_cheapness(df.reset_index(drop=True))
+    st.session_state["cheap_cache"] = (edges, cheap_df)
+    return cheap_df.copy()
 
 
 # --- Streamlit app -----------------------------------------------------------
@@ -176,6 +408,8 @@ def main():
             index=0,
         )
 
+        st.checkbox("Show debug info", key="debug")
+
         if st.button("Fetch & calculate next 48h"):
             st.session_state["run"] = True
 
@@ -183,46 +417,73 @@ def main():
         st.info("Configure settings in the sidebar and click **Fetch & calculate next 48h**.")
         return
 
-    now_utc = dt.datetime.now(dt.timezone.utc)
+    now_utc = floor_to_slot(dt.datetime.now(dt.timezone.utc))
     end_utc = now_utc + dt.timedelta(hours=48)
 
-    # Fetch Agile
-    try:
-        with st.spinner("Getting Agile prices from Octopus…"):
-            agile_df = get_agile_prices(
-                product_code=product_code.strip(),
-                region_code=region_code.strip().upper(),
-                start_utc=now_utc,
-                end_utc=end_utc,
+    product_code = product_code.strip()
+    region_code = region_code.strip().upper()
+    slot_cache = get_slot_cache(product_code, region_code, now_utc)
+
+    # Only fetch Agile from the first slot not already cached
+    fetch_from = first_missing_slot(slot_cache, now_utc)
+
+    if fetch_from < end_utc:
+        # Agile and Elexon fetches are independent, so run them side by side.
+        # The workers get this script run's context so the cached calls behave
+        # as they would on the script thread.
+        with (
+            st.spinner("Getting prices from Octopus and Elexon…"),
+            ThreadPoolExecutor(max_workers=2,
+                               initializer=add_script_run_ctx,
+                               initargs=(None, get_script_run_ctx())) as ex,
+        ):
+            agile_future = ex.submit(
+                _cached_agile,
+                product_code,
+                region_code,
+                fetch_from.isoformat(),
+                end_utc.isoformat(),
             )
-    except Exception as e:
-        st.error(f"Error getting Agile prices: {e}")
-        return
+            system_future = ex.submit(get_system_prices_today_and_tomorrow, now_utc)
 
-    if agile_df.empty:
-        st.warning("No Agile data returned for the given product / region over the next 48 hours.")
-        return
+        try:
+            agile_df = agile_future.result()
+        except Exception as e:
+            st.error(f"Error getting Agile prices: {e}")
+            return
 
-    # Fetch system prices for today and tomorrow
-    try:
-        with st.spinner("Getting system prices from Elexon…"):
-            system_df = get_system_prices_today_and_tomorrow(now_utc)
-    except Exception as e:
-        st.error(f"Error getting system prices from Elexon: {e}")
-        return
+        if agile_df.empty and not slot_cache:
+            st.warning("No Agile data returned for the given product / region over the next 48 hours.")
+            return
 
-    if system_df.empty:
-        st.warning("No system price data returned from Elexon for today/tomorrow.")
+        # System prices for today and tomorrow
+        try:
+            system_df = system_future.result()
+        except Exception as e:
+            st.error(f"Error getting system prices from Elexon: {e}")
+            return
+
+        if system_df.empty and not slot_cache:
+            st.warning("No system price data returned from Elexon for today/tomorrow.")
+            return
+
+        if st.session_state.get("debug") and not (agile_df.empty or system_df.empty):
+            with st.expander("Debug", expanded=False):
+                a_range = agile_df["start"].agg(["min", "max"])
+                s_range = system_df["start"].agg(["min", "max"])
+                st.write("Agile rows:", len(agile_df), "System rows:", len(system_df))
+                st.write("Agile time range:", a_range["min"], a_range["max"])
+                st.write("System time range:", s_range["min"], s_range["max"])
+
+        refresh_system_prices(slot_cache, system_df)
+        update_slot_cache(slot_cache, align_prices(agile_df, system_df))
+
+    if not slot_cache:
+        st.warning("Could not compute cheapness score (no overlapping Agile & system price data).")
         return
-    st.write("Agile rows:", len(agile_df), "System rows:", len(system_df))
-    st.write("Agile time range:", agile_df["start"].min(), agile_df["start"].max())
-    st.write("System time range:", system_df["start"].min(), system_df["start"].max())
 
     # Compute cheapness
-    cheap_df = compute_cheapness(agile_df, system_df)
-    if cheap_df.empty:
-        st.warning("Could not compute cheapness score (no overlapping Agile & system price data).")
-        return
+    cheap_df = cheapness_from_slot_cache(slot_cache)
 
     # Timezone choice
     if tz_choice.startswith("Local"):